@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Compares the recursive tree walker with the StackEvaluator, shows how
++= on strings scales with the number of appends and times specialized
+against generic arithmetic sites.
+
+Run as python -m <package>.benchmark from the directory above the package.
+"""
+import sys
+import time
+
+from .parser import parser
+from .lexer import PLYCompatLexer
+from .environment import Environment
+from .language import TypeProfile
+from .stackeval import evaluate
+
+
+def deep_chain(length):
+    return 'b=' + '+'.join(['a'] * length)
+
+
+def deep_blocks(depth):
+    return '\n'.join(' ' * level + 'if a' for level in range(depth)) + '\n' + ' ' * depth + 'b=a'
+
+
+def wide(length):
+    return '\n'.join('b=a+%d*2' % i for i in range(length))
+
+
+def timed(run, root, repeat):
+    start = time.time()
+    try:
+        for i in range(repeat):
+            run(root, Environment([{'a': 1}]))
+    except RuntimeError:
+        return None
+    return (time.time() - start) / repeat
+
+
+def recursive(root, namespace):
+    root.evaluate(namespace)
+
+
+def appends(count, augmented):
+    body = ' s+=a' if augmented else ' s=s+a'
+    root = parser.parse('s=""\nfor i in b\n' + body, lexer=PLYCompatLexer())
+    start = time.time()
+    root.evaluate(Environment([{'a': 'x' * 100, 'b': range(count)}]))
+    return time.time() - start
+
+
+def arithmetic(count, warmup):
+    root = parser.parse('c=a+b', lexer=PLYCompatLexer())
+    for namespace in warmup:
+        root.evaluate(namespace)
+    namespace = {'a': 1, 'b': 2}
+    start = time.time()
+    for i in range(count):
+        root.evaluate(namespace)
+    return time.time() - start
+
+
+def main():
+    cases = [
+        ('deep chain 500', deep_chain(500), 200),
+        ('deep chain 20000', deep_chain(20000), 5),
+        ('deep blocks 200', deep_blocks(200), 200),
+        ('wide 5000', wide(5000), 20),
+    ]
+    for name, code, repeat in cases:
+        root = parser.parse(code, lexer=PLYCompatLexer())
+        results = []
+        for run in (recursive, evaluate):
+            t = timed(run, root, repeat)
+            results.append('RecursionError' if t is None else '%.3f ms' % (t * 1000))
+        sys.stdout.write('%-20s recursive: %-16s stack: %s\n' % (name, results[0], results[1]))
+    for count in (5000, 10000, 20000):
+        plain = '%.3f ms' % (appends(count, False) * 1000)
+        sys.stdout.write('%-20s s=s+a: %-20s s+=a: %.3f ms\n' % ('appends %d' % count, plain, appends(count, True) * 1000))
+    ints = [{'a': i, 'b': 1} for i in range(TypeProfile.warmup)]
+    mixed = [{'a': 'x', 'b': 'y'}] + ints
+    generic = '%.3f ms' % (arithmetic(200000, mixed) * 1000)
+    sys.stdout.write('%-20s generic: %-18s specialized: %.3f ms\n' % ('c=a+b 200000', generic, arithmetic(200000, ints) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import json
+import socket
+import sys
+
+
+def run(path, code, namespace=None, out=None):
+    """Run code on the server listening at path and return the resulting
+    namespace. out is called with (type, text) for every output."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    try:
+        stream = sock.makefile('r+b')
+        stream.write(json.dumps({'code': code, 'namespace': namespace or {}}) + '\n')
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if message['type'] == 'result':
+                return message['namespace']
+            if out is not None:
+                out(message['type'], message['text'])
+    finally:
+        sock.close()
+    raise IOError('connection closed before the result was sent')
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description='Run a script on a running interpreter server.')
+    argparser.add_argument('script', help='file with the script, - for stdin')
+    argparser.add_argument('-s', '--socket', required=True, help='path of the server socket')
+    argparser.add_argument('-n', '--namespace', default='{}', help='input namespace as json')
+    argparser.add_argument('-r', '--result', action='store_true', help='print the resulting namespace as json')
+    args = argparser.parse_args(argv)
+
+    if args.script == '-':
+        code = sys.stdin.read()
+    else:
+        with open(args.script) as f:
+            code = f.read()
+
+    def out(kind, text):
+        stream = sys.stderr if kind == 'error' else sys.stdout
+        stream.write('%s\n' % text)
+
+    namespace = run(args.socket, code, json.loads(args.namespace), out)
+    if args.result:
+        sys.stdout.write(json.dumps(namespace) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+from . import language
+
+
+class CodeGenerator(object):
+    """Translates a statement tree into the source of a python function.
+
+    Values that have no literal form (strings, lists, the raw arguments of a
+    Call) are kept in a constant table and referenced by index, so the
+    generated code hands out the very same objects as the tree walker.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.constants = []
+        self.depth = 0
+
+    def constant(self, value):
+        self.constants.append(value)
+        return 'k[%d]' % (len(self.constants) - 1)
+
+    def emit(self, line, indent):
+        self.lines.append('    ' * indent + line)
+
+    def statement(self, node, indent):
+        if isinstance(node, language.StatementList):
+            for statement in node.list:
+                self.statement(statement, indent)
+        elif isinstance(node, language.AugmentedAssignment) and not node.left.subscriptions:
+            # grows strings and lists in place like the tree walker does
+            self.emit('if %s.accumulates(ns):' % self.constant(node), indent)
+            self.emit('ns.accumulate(%r, %s)' % (node.left.name, self.expression(node.right.right)), indent + 1)
+            self.emit('else:', indent)
+            self.emit('%s = %s' % (self.variable(node.left), self.expression(node.right)), indent + 1)
+        elif isinstance(node, language.Assignment):
+            self.emit('%s = %s' % (self.variable(node.left), self.expression(node.right)), indent)
+        elif isinstance(node, language.Nop):
+            self.emit('pass', indent)
+        elif isinstance(node, language.PrintStatement):
+            self.emit('ns.stdout(%s)' % self.expression(node.expr), indent)
+        elif isinstance(node, language.If):
+            self.emit('if %s:' % self.expression(node.condition), indent)
+            self.statement(node.block, indent + 1)
+        elif isinstance(node, language.Forloop):
+            var = '_v%d' % self.depth
+            outermost = not self.depth
+            if outermost:
+                # only the outermost loop of the function tells the namespace
+                self.emit('ns.enter_loop()', indent)
+                self.emit('try:', indent)
+                indent += 1
+            self.depth += 1
+            self.emit('for %s in %s:' % (var, self.expression(node.iterable)), indent)
+            self.emit('ns.push_stacklevel()', indent + 1)
+            self.emit('ns.set_local_key(%r, %s)' % (node.varname, var), indent + 1)
+            self.statement(node.block, indent + 1)
+            self.emit('ns.pop_stacklevel()', indent + 1)
+            self.depth -= 1
+            if outermost:
+                self.emit('finally:', indent - 1)
+                self.emit('ns.leave_loop()', indent)
+        else:
+            # statements without a compiled form run through the tree walker
+            self.emit('%s.evaluate(ns)' % self.constant(node), indent)
+
+    def expression(self, node):
+        if isinstance(node, language.TwoValueOperation):
+            return '(%s %s %s)' % (self.expression(node.left), node.symbol, self.expression(node.right))
+        if isinstance(node, language.Variable):
+            return self.variable(node)
+        if isinstance(node, language.Call):
+            args = ', '.join(self.argument(a) for a in node.args)
+            return '%s(%s)' % (self.variable(node.function), args)
+        if isinstance(node, language.ListLiteral):
+            return 'list(%s)' % self.constant(node.pool[node.index])
+        if isinstance(node, language.Expression):
+            return self.expression(node.sub_expr)
+        if type(node) is int:
+            return repr(node)
+        if type(node) in (unicode, str, list):
+            return self.constant(node)
+        raise TypeError('cant get value of %s' % type(node))
+
+    def argument(self, node):
+        # functions evaluate expression arguments in the namespace of the call
+        if isinstance(node, language.Expression):
+            return '%s.set_namespace(ns)' % self.constant(node)
+        return self.constant(node)
+
+    def variable(self, node):
+        code = 'ns[%r]' % node.name
+        for sub in node.subscriptions:
+            if isinstance(sub, language.Expression):
+                code += '[%s]' % self.expression(sub)
+            else:
+                code += '[%s]' % self.constant(sub)
+        return code
+
+    def source(self):
+        return '\n'.join(['def run(ns):'] + (self.lines or ['    pass']))
+
+
+def compile_tree(node):
+    """Compile a StatementList (or a single statement) into a function
+    taking the namespace, with the same semantics as node.evaluate."""
+    generator = CodeGenerator()
+    generator.statement(node, 1)
+    scope = {'k': generator.constants}
+    code = compile(generator.source(), '<dsl>', 'exec', 0, True)
+    exec code in scope
+    return scope['run']
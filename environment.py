@@ -1,3 +1,43 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from copy import deepcopy
+
+from .language import Expression
+
+
+class Accumulator(object):
+    """Pending result of repeated += on a string or a list.
+
+    Strings are kept as a list of chunks and lists are extended in place,
+    so growing a value by += is amortized O(1). The accumulator is replaced
+    by the real value as soon as it is read.
+    """
+
+    def __init__(self, value):
+        self.kind = type(value)
+        if self.kind is list:
+            # a copy, so extending it in place is invisible to aliases
+            self.parts = list(value)
+        else:
+            self.parts = [value]
+
+    def add(self, value):
+        if type(value) is not self.kind:
+            return False
+        if self.kind is list:
+            self.parts.extend(value)
+        else:
+            self.parts.append(value)
+        return True
+
+    def materialize(self):
+        if self.kind is list:
+            return self.parts
+        return self.kind().join(self.parts)
+
+
 class SysGlobal(object):
     readonly = ('locals', 'globals')
 
@@ -6,13 +46,18 @@ class SysGlobal(object):
 
     def __getitem__(self, value):
         if value == 'locals':
+            self.env.escape(self.env.stack[-1])
             return self.env.stack[-1]
         if value == 'globals':
+            self.env.escape()
             return self.env.stack
         raise IndexError('nicht vorhanden')
 
 
 class StdLen(object):
+    # calls have no side effects
+    pure = True
+
     def __init__(self, env):
         self.env = env
 
@@ -21,15 +66,98 @@ class StdLen(object):
         return len(target)
 
 
+class LRUCache(object):
+    """Bounded cache of call results with optional expiry in seconds."""
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.uncacheable = self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and (self.ttl is None or time.time() - entry[1] < self.ttl):
+                self.entries[key] = entry
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            if self.maxsize is not None and len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        calls = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'uncacheable': self.uncacheable,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'hit_rate': float(self.hits) / calls if calls else 0.0,
+        }
+
+
+# caches of pure globals registered with shared=True, by function id,
+# maxsize and ttl; a cache lives as long as a PureGlobal using it
+shared_caches = weakref.WeakValueDictionary()
+
+# result types that are handed out from a cache without a copy
+IMMUTABLE = (int, long, float, bool, str, unicode, type(None))
+
+
+class PureGlobal(object):
+    """Wraps a deterministic function so calls with the same hashable
+    arguments are answered from a cache.
+
+    Arguments that are expressions (variables passed to a call) are
+    evaluated in the namespace of the call first, so the function receives
+    plain values. Results that can be changed are copied for every caller.
+    """
+    pure = True
+
+    def __init__(self, function, cache):
+        self.function = function
+        self.cache = cache
+
+    def __call__(self, *args):
+        args = tuple(a.value if isinstance(a, Expression) else a for a in args)
+        try:
+            hash(args)
+        except TypeError:
+            self.cache.uncacheable += 1
+            return self.function(*args)
+        found, value = self.cache.get(args)
+        if not found:
+            value = self.function(*args)
+            self.cache.put(args, value)
+        if type(value) in IMMUTABLE:
+            return value
+        return deepcopy(value)
+
+
 class Environment(object):
-    def __init__(self, stack=None):
+    def __init__(self, stack=None, loader=None):
         if stack is None:
             self.stack = [{}]
         else:
             self.stack = stack
+        self.loader = loader
         self.globals = {}
         self.backlog = []
         self.out_handlers = []
+        # ids of scopes handed out as dicts, which never hold accumulators
+        self.escaped = set()
+        self.all_escaped = False
+        # number of loops running; += only accumulates inside loops
+        self.loop_depth = 0
 
         # std globals
         self.register_global('sys', SysGlobal(self))
@@ -49,17 +177,48 @@ class Environment(object):
     def register_global(self, key, obj):
         self.globals[key] = obj
 
+    def register_pure_global(self, key, function, maxsize=128, ttl=None, shared=False):
+        """Register a deterministic function whose results are cached.
+
+        The cache holds up to maxsize results for at most ttl seconds and
+        belongs to this environment, or with shared to every environment
+        registering the same function with the same maxsize and ttl.
+        """
+        if shared:
+            shared_key = (id(function), maxsize, ttl)
+            cache = shared_caches.get(shared_key)
+            if cache is None:
+                cache = shared_caches[shared_key] = LRUCache(maxsize, ttl)
+        else:
+            cache = LRUCache(maxsize, ttl)
+        self.register_global(key, PureGlobal(function, cache))
+
+    def cache_stats(self):
+        """Cache statistics of the pure globals, by name."""
+        return dict((key, obj.cache.stats()) for key, obj in self.globals.items() if isinstance(obj, PureGlobal))
+
+    def import_module(self, name):
+        """Make the module name available as a read-only global."""
+        if self.loader is None:
+            from .modules import default_loader
+            self.loader = default_loader
+        module = self.loader.load(name)
+        self.register_global(name, module)
+        return module
+
     def evaluate_statement_list(self, statement_list):
         try:
             statement_list.evaluate(self)
         except Exception as e:
             self.stderr(str(e))
+        finally:
+            self.flush()
 
     def push_stacklevel(self):
         self.stack.append({})
 
     def pop_stacklevel(self):
-        self.stack.pop()
+        self.escaped.discard(id(self.stack.pop()))
 
     def get_highest_level(self, key):
         for level in range(len(self.stack) - 1, -1, -1):
@@ -69,7 +228,53 @@ class Environment(object):
             return -1  # global
         return None
 
+    def accumulate(self, key, value):
+        """Equivalent of self[key] = self[key] + value that defers building
+        strings and lists until the result is read."""
+        scope = self.stack[self.get_highest_level(key)]
+        current = scope[key]
+        if self.all_escaped or id(scope) in self.escaped:
+            scope[key] = current + value
+            return
+        if type(current) is Accumulator:
+            if current.add(value):
+                return
+            current = current.materialize()
+        elif type(current) in (str, unicode, list) and type(value) is type(current):
+            accumulator = Accumulator(current)
+            accumulator.add(value)
+            scope[key] = accumulator
+            return
+        scope[key] = current + value
+
+    def enter_loop(self):
+        self.loop_depth += 1
+
+    def leave_loop(self):
+        """Leaving the outermost loop replaces the accumulators by their
+        values, so none are left once a statement has finished."""
+        self.loop_depth -= 1
+        if not self.loop_depth:
+            self.flush()
+
+    def escape(self, scope=None):
+        """Flush scope (or every scope) before it is handed out as a dict,
+        and stop accumulating in it, since the dict may be read directly."""
+        if scope is None:
+            self.all_escaped = True
+        else:
+            self.escaped.add(id(scope))
+        self.flush()
+
+    def flush(self):
+        """Replace all pending accumulators by their values."""
+        for scope in self.stack:
+            for key, value in scope.items():
+                if type(value) is Accumulator:
+                    scope[key] = value.materialize()
+
     def __repr__(self):
+        self.flush()
         return repr(self.stack)
 
     def __getitem__(self, key):
@@ -78,7 +283,10 @@ class Environment(object):
             raise KeyError('key %s is not defined' % key)
         if level == -1:  # global
             return self.globals[key]
-        return self.stack[level][key]
+        value = self.stack[level][key]
+        if type(value) is Accumulator:
+            value = self.stack[level][key] = value.materialize()
+        return value
 
     def __setitem__(self, key, value):
         level = self.get_highest_level(key)
@@ -94,4 +302,6 @@ class Environment(object):
         self.stack[level][key] = value
 
     def __cmp__(self, other):
+        self.flush()
+        other.flush()
         return cmp(self.stack, other.stack)
@@ -2,5 +2,6 @@ class CompileException(BaseException):
     pass
 
 
-class ReadOnlyGlobal(BaseException):
+class ReadOnlyGlobal(Exception):
+    # raised at runtime, so it is reported like any other runtime error
     pass
@@ -0,0 +1,158 @@
+import bisect
+
+from . import language
+
+# marks a name that is not defined
+ABSENT = object()
+
+
+class StatementInfo(object):
+    """Names a top-level statement reads and writes.
+
+    in_place is set if the statement may change a value in place (a write
+    through a subscription, a parallel loop or the scope dicts of sys), which
+    is then visible through every name referring to the same value.
+    """
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.reads = set()
+        self.writes = set()
+        self.calls = set()
+        self.prints = False
+        self.in_place = False
+        targets = set()
+        for node in language.walk(statement):
+            if isinstance(node, language.Assignment):
+                self.writes.add(node.left.name)
+                if node.left.subscriptions:
+                    self.in_place = True
+                elif not isinstance(node, language.AugmentedAssignment):
+                    targets.add(id(node.left))
+            elif isinstance(node, (language.PrintStatement, language.Import)):
+                self.prints = True
+            elif isinstance(node, language.Call):
+                self.calls.add(node.function.name)
+            elif hasattr(node, 'check'):
+                # parallel loops write the containers they index
+                self.writes.update(node.check.containers)
+                self.in_place = True
+        for node in language.walk(statement):
+            if isinstance(node, language.Variable) and id(node) not in targets:
+                self.reads.add(node.name)
+                if node.name == 'sys':
+                    self.in_place = True
+
+    def calls_impure(self, env):
+        for name in self.calls:
+            level = env.get_highest_level(name)
+            if level is None or not getattr(env[name], 'pure', False):
+                return True
+        return False
+
+    def has_side_effects(self, env):
+        return self.prints or self.calls_impure(env)
+
+
+class IncrementalProgram(object):
+    """Runs a StatementList and later re-runs only what a change affects.
+
+    After run(), update() takes new values for some inputs and re-executes
+    the top-level statements reading a changed name, transitively, plus
+    every statement that prints, imports or calls a function not marked as
+    pure. All other statements keep the values they produced before.
+
+    Values of names written by several statements are remembered per
+    statement, so a re-run statement sees the same values it would in a
+    full run. Since values are not copied, this only holds if no value is
+    changed in place; a program with a statement that may do so (see
+    StatementInfo.in_place) or that calls a function not marked as pure,
+    which may change its arguments, is re-run in full by update().
+    """
+
+    def __init__(self, statement_list):
+        self.infos = [StatementInfo(s) for s in statement_list.list]
+        self.writers = {}
+        for index, info in enumerate(self.infos):
+            for name in info.writes:
+                self.writers.setdefault(name, []).append(index)
+        self.in_place = any(info.in_place for info in self.infos)
+        self.full = self.in_place
+        self.snapshots = {}
+
+    def needs_full(self, env):
+        # functions are looked up in env, so this is only known at run time
+        return self.in_place or any(info.calls_impure(env) for info in self.infos)
+
+    def get(self, env, name):
+        level = env.get_highest_level(name)
+        if level is None or level == -1:
+            return ABSENT
+        return env.stack[level][name]
+
+    def set(self, env, name, value):
+        if value is not ABSENT:
+            env[name] = value
+            return
+        level = env.get_highest_level(name)
+        if level is not None and level != -1:
+            del env.stack[level][name]
+
+    def restore(self, env, index, name):
+        """Put the value name has right before statement index in env."""
+        writers = self.writers.get(name, [])
+        position = bisect.bisect_left(writers, index)
+        key = (writers[position - 1] if position else -1, name)
+        if key in self.snapshots:
+            self.set(env, name, self.snapshots[key])
+
+    def execute(self, env, index):
+        info = self.infos[index]
+        if not self.full:
+            for name in info.reads | info.writes:
+                if name in self.writers:
+                    self.restore(env, index, name)
+        info.statement.evaluate(env)
+        env.flush()
+        if not self.full:
+            for name in info.writes:
+                self.snapshots[index, name] = self.get(env, name)
+
+    def run(self, env):
+        """Run every statement and remember what they produced."""
+        self.snapshots = {}
+        self.full = self.needs_full(env)
+        env.flush()
+        if not self.full:
+            for name in self.writers:
+                self.snapshots[-1, name] = self.get(env, name)
+        for index in range(len(self.infos)):
+            self.execute(env, index)
+        return range(len(self.infos))
+
+    def update(self, env, changes):
+        """Set the inputs in changes and re-run the affected statements.
+
+        Returns the indices of the statements that ran.
+        """
+        for name, value in changes.items():
+            if name in self.writers:
+                self.snapshots[-1, name] = value
+            self.set(env, name, value)
+        self.full = self.full or self.needs_full(env)
+        if self.full:
+            for index in range(len(self.infos)):
+                self.execute(env, index)
+            return range(len(self.infos))
+        dirty = set(changes)
+        executed = []
+        touched = set()
+        for index, info in enumerate(self.infos):
+            if info.reads & dirty or info.has_side_effects(env):
+                self.execute(env, index)
+                dirty |= info.writes
+                touched |= info.reads | info.writes
+                executed.append(index)
+        for name in touched & set(self.writers):
+            self.restore(env, len(self.infos), name)
+        return executed
@@ -1,4 +1,128 @@
 import operator
+from array import array
+
+
+def walk(root):
+    """Yield every node of the tree below (and including) root."""
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        yield node
+        pending.extend(reversed(node.children()))
+
+
+class TypeProfile(object):
+    """Records the operand types seen at one site during warm-up.
+
+    A site without specializations only records; its state ends up as
+    'profiled'.
+    """
+    warmup = 8
+
+    def __init__(self, specializations=()):
+        self.specializations = specializations
+        self.types = {}
+        self.samples = 0
+        self.state = 'warmup'
+        self.deopts = 0
+
+    def record(self, *values):
+        if self.state != 'warmup':
+            return
+        for v in values:
+            self.types[type(v)] = self.types.get(type(v), 0) + 1
+        self.samples += 1
+        if self.samples >= self.warmup:
+            if not self.specializations:
+                self.state = 'profiled'
+            elif len(self.types) == 1 and list(self.types)[0] in self.specializations:
+                self.state = list(self.types)[0].__name__
+            else:
+                self.state = 'generic'
+        return self.state
+
+    def deoptimize(self):
+        self.state = 'generic'
+        self.deopts += 1
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'samples': self.samples,
+            'deopts': self.deopts,
+            'types': dict((t.__name__, c) for t, c in self.types.items()),
+        }
+
+
+def site_label(node):
+    """A short label for a site, naming only its direct operands."""
+    if isinstance(node, Variable):
+        return node.name + '[]' * len(node.subscriptions)
+    if isinstance(node, TwoValueOperation):
+        return '%s %s %s' % (operand_label(node.left), node.symbol, operand_label(node.right))
+    return type(node).__name__
+
+
+def operand_label(node):
+    if isinstance(node, Variable):
+        return site_label(node)
+    if type(node) is Expression and type(node.sub_expr) in (int, str):
+        return repr(node.sub_expr)
+    return '(...)'
+
+
+def specialization_stats(root):
+    """Return the type profile of every arithmetic and variable site.
+
+    Variable sites are only profiled, arithmetic sites are specialized.
+    """
+    stats = []
+    for node in walk(root):
+        if isinstance(node, (TwoValueOperation, Variable)):
+            s = node.profile.stats()
+            s['site'] = '%s %s' % (site_label(node), hex(id(node)))
+            s['kind'] = type(node).__name__
+            stats.append(s)
+    return stats
+
+
+class ConstantPool(object):
+    """The literal lists of one program, each stored once.
+
+    Lists of integers are kept in an array, other lists in a tuple.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+
+    def add(self, values):
+        if type(values) is array:
+            storage = values
+        else:
+            storage = tuple(values)
+            if all(type(v) is int for v in storage):
+                try:
+                    storage = array('l', storage)
+                except OverflowError:
+                    pass
+        if type(storage) is array:
+            key = (array, len(storage), hash(storage.tostring()))
+        else:
+            key = (tuple, len(storage), hash(storage))
+        candidates = self.lookup.setdefault(key, [])
+        for index in candidates:
+            if self.values[index] == storage:
+                return index
+        self.values.append(storage)
+        candidates.append(len(self.values) - 1)
+        return len(self.values) - 1
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __len__(self):
+        return len(self.values)
 
 
 class StatementList(object):
@@ -11,13 +135,17 @@ class StatementList(object):
     def append(self, statement):
         self.list.append(statement)
 
+    def children(self):
+        return self.list
+
     def evaluate(self, namespace):
         for statement in self.list:
             statement.evaluate(namespace)
 
 
 class Statement(object):
-    pass
+    def children(self):
+        return []
 
 
 class Assignment(Statement):
@@ -25,6 +153,9 @@ class Assignment(Statement):
         self.left = left
         self.right = right
 
+    def children(self):
+        return [self.left, self.right]
+
     def evaluate(self, namespace):
         self.left.set_namespace(namespace).value = self.right.set_namespace(namespace).value
 
@@ -32,6 +163,24 @@ class Assignment(Statement):
         return "<Assignment %s = %s>" % (self.left, self.right)
 
 
+class AugmentedAssignment(Assignment):
+    """x += y, evaluated as x = x + y.
+
+    Strings and lists in an Environment are grown through
+    Environment.accumulate inside loops, so repeated appends do not copy the
+    value. The values are materialized when the outermost loop finishes.
+    """
+
+    def accumulates(self, namespace):
+        return (getattr(namespace, 'loop_depth', 0) > 0 and not self.left.subscriptions and
+                namespace.get_highest_level(self.left.name) not in (None, -1))
+
+    def evaluate(self, namespace):
+        if not self.accumulates(namespace):
+            return Assignment.evaluate(self, namespace)
+        namespace.accumulate(self.left.name, self.right.right.set_namespace(namespace).value)
+
+
 class Nop(Statement):
     def evaluate(self, namespace):
         pass
@@ -41,10 +190,24 @@ class PrintStatement(Statement):
     def __init__(self, expr):
         self.expr = expr
 
+    def children(self):
+        return [self.expr]
+
     def evaluate(self, namespace):
         namespace.stdout(self.expr.set_namespace(namespace).value)
 
 
+class Import(Statement):
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "<Import %s>" % self.name
+
+    def evaluate(self, namespace):
+        namespace.import_module(self.name)
+
+
 class Expression(object):
     def __init__(self, sub_expr):
         self.sub_expr = sub_expr
@@ -52,6 +215,11 @@ class Expression(object):
     def __repr__(self):
         return repr(self.sub_expr)
 
+    def children(self):
+        if isinstance(self.sub_expr, Expression):
+            return [self.sub_expr]
+        return []
+
     @property
     def value(self):
         if isinstance(self.sub_expr, Variable):
@@ -66,43 +234,164 @@ class Expression(object):
         return self
 
 
+class ListLiteral(Expression):
+    """A list literal without variables, kept in a ConstantPool.
+
+    Every evaluation returns a new list, so changes to it never show up in
+    later evaluations.
+    """
+
+    def __init__(self, pool, values):
+        self.pool = pool
+        self.index = pool.add(values)
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def children(self):
+        return []
+
+    @property
+    def value(self):
+        return list(self.pool[self.index])
+
+
+def reader(node):
+    """A function returning the value of node in a namespace.
+
+    Literals and plain variables are read directly instead of through
+    set_namespace and the value property.
+    """
+    if type(node) is Variable and not node.subscriptions:
+        name = node.name
+        return lambda namespace: namespace[name]
+    if type(node) is Expression and type(node.sub_expr) in (int, str):
+        constant = node.sub_expr
+        return lambda namespace: constant
+    return lambda namespace: node.set_namespace(namespace).value
+
+
 class TwoValueOperation(Expression):
+    """An arithmetic site.
+
+    A new site profiles its operand types. After warm-up it switches its
+    class to the generic variant of its operation, which calls the operator
+    directly, or to the specialized variant, which applies the operator
+    inline behind a type guard and turns generic when the guard fails.
+    """
+    # operand types that get a guarded fast path after warm-up
+    specializations = (int,)
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
+        self.profile = TypeProfile(self.specializations)
 
     def __repr__(self):
         return '%s %s %s' % (self.left, self.operation, self.right)
 
+    def children(self):
+        return [self.left, self.right]
+
     @property
     def value(self):
-        return self.operation(self.left.set_namespace(self.namespace).value, self.right.set_namespace(self.namespace).value)
+        return self.compute(self.left.set_namespace(self.namespace).value, self.right.set_namespace(self.namespace).value)
+
+    def compute(self, left, right):
+        state = self.profile.record(left, right)
+        if state == 'generic':
+            self.__class__ = self.generic
+        elif state != 'warmup':
+            self.guard = type(left)
+            self.read_left = reader(self.left)
+            self.read_right = reader(self.right)
+            self.__class__ = self.specialized
+        return self.operation(left, right)
+
+    def guarded(self, left, right):
+        if type(left) is self.guard is type(right):
+            return self.operation(left, right)
+        return self.deoptimize(left, right)
+
+    def deoptimize(self, left, right):
+        self.profile.deoptimize()
+        self.__class__ = self.generic
+        return self.operation(left, right)
 
 
 class Addition(TwoValueOperation):
+    symbol = '+'
     operation = operator.add
+    specializations = (int, str)
+
+    def fast_value(self):
+        left = self.read_left(self.namespace)
+        right = self.read_right(self.namespace)
+        if type(left) is self.guard is type(right):
+            return left + right
+        return self.deoptimize(left, right)
 
 
 class Substraction(TwoValueOperation):
+    symbol = '-'
     operation = operator.sub
 
+    def fast_value(self):
+        left = self.read_left(self.namespace)
+        right = self.read_right(self.namespace)
+        if type(left) is self.guard is type(right):
+            return left - right
+        return self.deoptimize(left, right)
+
 
 class Multiplication(TwoValueOperation):
+    symbol = '*'
     operation = operator.mul
 
+    def fast_value(self):
+        left = self.read_left(self.namespace)
+        right = self.read_right(self.namespace)
+        if type(left) is self.guard is type(right):
+            return left * right
+        return self.deoptimize(left, right)
+
 
 class Division(TwoValueOperation):
+    symbol = '/'
     operation = operator.div
 
+    def fast_value(self):
+        left = self.read_left(self.namespace)
+        right = self.read_right(self.namespace)
+        if type(left) is self.guard is type(right):
+            return left / right
+        return self.deoptimize(left, right)
+
+
+def generic_value(self):
+    return self.operation(self.left.set_namespace(self.namespace).value, self.right.set_namespace(self.namespace).value)
+
+
+for cls in (Addition, Substraction, Multiplication, Division):
+    # the classes a site switches to after warm-up, named like the operation
+    cls.generic = type(cls.__name__, (cls,), {'value': property(generic_value), 'compute': staticmethod(cls.operation)})
+    cls.specialized = type(cls.__name__, (cls,), {'value': property(cls.fast_value.im_func), 'compute': cls.guarded.im_func})
+del cls
+
 
 class Variable(Expression):
     def __init__(self, name):
         self.name = name
         self.subscriptions = []
+        # reads are profiled for statistics, never specialized
+        self.profile = TypeProfile()
 
     def __repr__(self):
         return "<Variable %s>" % self.name
 
+    def children(self):
+        return [s for s in self.subscriptions if isinstance(s, Expression)]
+
     def add_subscription(self, sub):
         self.subscriptions.append(sub)
 
@@ -122,10 +411,13 @@ class Variable(Expression):
     @property
     def value(self):
         if not self.subscriptions:
-            return self.namespace[self.name]
-        var = self.namespace[self.name]
-        for sub in self.subscriptions:
-            var = var[self.sub_to_index(sub)]
+            var = self.namespace[self.name]
+        else:
+            var = self.namespace[self.name]
+            for sub in self.subscriptions:
+                var = var[self.sub_to_index(sub)]
+        if self.profile.state == 'warmup':
+            self.profile.record(var)
         return var
 
     @value.setter
@@ -142,19 +434,54 @@ class Variable(Expression):
     def value(self):
         del self.namespace[self.name]
 
+    def lookup(self, namespace, indices):
+        """Like value, with the subscriptions already evaluated."""
+        var = namespace[self.name]
+        for index in indices:
+            var = var[index]
+        if self.profile.state == 'warmup':
+            self.profile.record(var)
+        return var
+
+    def store(self, namespace, indices, value):
+        """Like setting value, with the subscriptions already evaluated."""
+        if not indices:
+            namespace[self.name] = value
+            return
+        var = namespace[self.name]
+        for index in indices[:-1]:
+            var = var[index]
+        var[indices[-1]] = value
+
 
 class Forloop(object):
     def __init__(self, varname, iterable, block):
         self.varname = varname
         self.iterable = iterable
         self.block = block
+        # set by a TieredRunner
+        self.tiering = None
+        self.compiled = None
+        self.iterations = 0
+
+    def children(self):
+        return [self.iterable, self.block]
 
     def evaluate(self, namespace):
-        for var in self.iterable.set_namespace(namespace).value:
-            namespace.push_stacklevel()
-            namespace.set_local_key(self.varname, var)
-            self.block.evaluate(namespace)
-            namespace.pop_stacklevel()
+        if self.compiled is not None:
+            return self.compiled(namespace)
+        namespace.enter_loop()
+        try:
+            for var in self.iterable.set_namespace(namespace).value:
+                namespace.push_stacklevel()
+                namespace.set_local_key(self.varname, var)
+                self.block.evaluate(namespace)
+                namespace.pop_stacklevel()
+                self.iterations += 1
+        finally:
+            namespace.leave_loop()
+        if self.tiering is not None:
+            self.tiering.loop_finished(self)
 
 
 class If(object):
@@ -165,6 +492,9 @@ class If(object):
     def __repr__(self):
         return "<if %s [%s]>" % (self.condition, self.block)
 
+    def children(self):
+        return [self.condition, self.block]
+
     def evaluate(self, namespace):
         if self.condition.set_namespace(namespace).value:
             self.block.evaluate(namespace)
@@ -175,6 +505,13 @@ class Call(Expression):
         self.function = function
         self.args = args
 
+    def children(self):
+        return [self.function] + [a for a in self.args if isinstance(a, Expression)]
+
+    def arguments(self, namespace):
+        """The arguments, with expressions set to the namespace of the call."""
+        return [a.set_namespace(namespace) if isinstance(a, Expression) else a for a in self.args]
+
     @property
     def value(self):
-        return self.function.set_namespace(self.namespace).value(*self.args)
+        return self.function.set_namespace(self.namespace).value(*self.arguments(self.namespace))
@@ -1,3 +1,5 @@
+import re
+from array import array
 from itertools import takewhile
 from copy import copy
 from ply import lex
@@ -6,10 +8,14 @@ from .exceptions import CompileException
 
 
 class PLYCompatLexer(object):
-    def __init__(self, auto_end=True, debug=False):
+    def __init__(self, auto_end=True, debug=False, lexer=None):
         self.auto_end = auto_end
         self.debug = debug
-        self.lexer = lex.lex()
+        if lexer is None:
+            self.lexer = lex.lex()
+        else:
+            # reuse the tables of an already built lexer
+            self.lexer = lexer.clone()
         self.extra_tokens = []
         self.indent_levels = ['']
 
@@ -72,11 +78,14 @@ reserved = {
     'print': 'PRINT',
     'for': 'FOR',
     'in': 'IN',
+    'parallel': 'PARALLEL',
+    'import': 'IMPORT',
 }
 
 tokens = [
     'STRING',
     'NUMBER',
+    'NUMBER_LIST',
     'NAME',
     'ASSIGN',
     'DOT',
@@ -119,6 +128,26 @@ def t_STRING(t):
     return t
 
 
+# rest of a list of numbers after the opening bracket
+number_list_body = re.compile(r'[\d \t,]*\]')
+
+
+def t_NUMBER_LIST(t):
+    r'\[(?=[ \t]*\d+[ \t]*,[ \t]*\d)'
+    # a literal list of numbers as one token, for large data literals
+    match = number_list_body.match(t.lexer.lexdata, t.lexer.lexpos)
+    numbers = match.group()[:-1].split(',') if match else None
+    if numbers is None or not all(n.strip().isdigit() for n in numbers):
+        t.type = 'LSPAREN'
+        return t
+    t.lexer.lexpos = match.end()
+    try:
+        t.value = array('l', (int(n) for n in numbers))
+    except OverflowError:
+        t.value = [int(n) for n in numbers]
+    return t
+
+
 def t_NUMBER(t):
     r'\d+'
     t.value = int(t.value)
@@ -130,11 +159,16 @@ t_NAME = r'[a-z]+'
 
 # check for reserved words
 def t_RESERVED(t):
-    r'if|for|in|nop|print'
+    r'if|for|in|nop|print|parallel|import'
     t.type = reserved.get(t.value, 'ID')
     return t
 
 
+def build_lexer():
+    """Build a lexer that can be handed to PLYCompatLexer to be cloned."""
+    return lex.lex()
+
+
 def t_error(t):
     raise CompileException(u"Cannot make sense of char: %s" % t.value[0])
 
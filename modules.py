@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+
+from .parser import parser
+from .lexer import PLYCompatLexer, build_lexer
+from .codegen import compile_tree
+from .exceptions import CompileException, ReadOnlyGlobal
+
+
+def read_only(self, *args, **kwargs):
+    raise ReadOnlyGlobal('values of modules are read only')
+
+
+class ReadOnlyList(list):
+    """A list of a module namespace, which cannot be changed."""
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = read_only
+    append = extend = insert = pop = remove = reverse = sort = read_only
+
+    def __reduce__(self):
+        return (ReadOnlyList, (list(self),))
+
+
+class ReadOnlyDict(dict):
+    """A dict of a module namespace, which cannot be changed."""
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = read_only
+
+    def __reduce__(self):
+        return (ReadOnlyDict, (dict(self),))
+
+
+def freeze(value):
+    """value with all lists and dicts in it replaced by read-only ones."""
+    if isinstance(value, list):
+        return ReadOnlyList(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return ReadOnlyDict((k, freeze(v)) for k, v in value.items())
+    return value
+
+
+class Module(object):
+    """A compiled module whose top-level code runs on first access.
+
+    Every Environment importing the module gets this same object; its
+    namespace can be read but not written, and neither can the lists and
+    dicts in it. Only its top-level names and the modules it imports can be
+    read. A module used while its own top-level code runs (an import cycle)
+    raises ImportError.
+    """
+
+    def __init__(self, name, path, run, loader):
+        self.name = name
+        self.path = path
+        self.run = run
+        self.loader = loader
+        self.env = None
+        self.loading = False
+
+    def __repr__(self):
+        return '<Module %s from %s>' % (self.name, self.path)
+
+    def namespace(self):
+        if self.env is None:
+            with self.loader.run_lock:
+                if self.env is None:
+                    if self.loading:
+                        raise ImportError('import cycle: module %s is used by its own top-level code' % self.name)
+                    from .environment import Environment
+                    env = Environment(loader=self.loader)
+                    self.loading = True
+                    try:
+                        self.run(env)
+                    finally:
+                        self.loading = False
+                    env.flush()
+                    env.stack[0] = ReadOnlyDict((k, freeze(v)) for k, v in env.stack[0].items())
+                    self.env = env
+        return self.env
+
+    def __getitem__(self, key):
+        env = self.namespace()
+        if key in env.stack[0]:
+            return env.stack[0][key]
+        # modules imported by this one, never std globals like sys
+        value = env.globals.get(key)
+        if isinstance(value, Module):
+            return value
+        raise KeyError('module %s has no %s' % (self.name, key))
+
+    def __setitem__(self, key, value):
+        raise ReadOnlyGlobal('module %s is read only' % self.name)
+
+    def __len__(self):
+        return len(self.namespace().stack[0])
+
+
+class ModuleLoader(object):
+    """Finds modules as <name>.dsl in the search paths and keeps each one
+    parsed and compiled once per process.
+
+    A cached module is reused as long as its file keeps its mtime, or its
+    content hash if only the mtime changed.
+    """
+    extension = '.dsl'
+
+    def __init__(self, paths=()):
+        self.paths = list(paths)
+        self.modules = {}
+        self.lexer = None
+        self.lock = threading.Lock()
+        # held while the top-level code of a module runs; one lock for all
+        # modules, so modules using each other cannot deadlock across threads
+        self.run_lock = threading.RLock()
+
+    def find(self, name):
+        for path in self.paths:
+            filename = os.path.join(path, name + self.extension)
+            if os.path.isfile(filename):
+                return filename
+        raise ImportError('module %s not found' % name)
+
+    def load(self, name):
+        filename = self.find(name)
+        mtime = os.path.getmtime(filename)
+        with self.lock:
+            cached = self.modules.get(name)
+            if cached is not None and cached[0] == filename and cached[1] == mtime:
+                return cached[3]
+            with open(filename) as f:
+                source = f.read()
+            digest = hashlib.sha1(source).hexdigest()
+            if cached is not None and cached[0] == filename and cached[2] == digest:
+                module = cached[3]
+            else:
+                module = Module(name, filename, self.compile(name, source), self)
+            self.modules[name] = (filename, mtime, digest, module)
+            return module
+
+    def compile(self, name, source):
+        if self.lexer is None:
+            self.lexer = build_lexer()
+        program = parser.parse(source, lexer=PLYCompatLexer(lexer=self.lexer))
+        if program is None:
+            raise CompileException('module %s is incomplete' % name)
+        try:
+            return compile_tree(program)
+        except Exception:
+            # e.g. SyntaxError from loops nested too deeply or RuntimeError
+            # from long expressions; the tree walker runs these
+            return program.evaluate
+
+
+# used by environments without a loader of their own
+default_loader = ModuleLoader(p for p in os.environ.get('DSL_PATH', '').split(os.pathsep) if p)
@@ -0,0 +1,209 @@
+import multiprocessing
+import sys
+import weakref
+
+from . import language
+from .environment import Environment
+from .exceptions import CompileException
+
+
+def read_names(node):
+    return [n.name for n in language.walk(node) if isinstance(n, language.Variable)]
+
+
+def mentions(node, name):
+    return isinstance(node, language.Expression) and name in read_names(node)
+
+
+class BodyCheck(object):
+    """Static check of a parallel loop body for cross-iteration dependencies.
+
+    Plain names assigned in the body are iteration locals and have to be
+    assigned before they are read; they may only be written through
+    subscriptions if they always hold a new list literal. Everything else
+    is shared: it may be read, or written with a single subscription
+    indexed by the loop variable, but a shared container that is written
+    must not be read.
+    """
+
+    def __init__(self, varname, block):
+        self.varname = varname
+        self.locals = set([varname])
+        self.containers = set()
+        # locals only ever bound to new list literals, which may be written
+        # through subscriptions without changing shared values
+        self.fresh = set()
+        bound = set([varname])
+        for node in language.walk(block):
+            if isinstance(node, language.Assignment) and not node.left.subscriptions:
+                self.locals.add(node.left.name)
+                if isinstance(node.right, language.ListLiteral) and not isinstance(node, language.AugmentedAssignment):
+                    self.fresh.add(node.left.name)
+                else:
+                    bound.add(node.left.name)
+            elif isinstance(node, (language.Forloop, ParallelForloop)):
+                self.locals.add(node.varname)
+                bound.add(node.varname)
+        self.fresh -= bound
+        for node in language.walk(block):
+            if isinstance(node, language.Assignment) and node.left.name not in self.locals:
+                self.containers.add(node.left.name)
+        self.block(block, set([varname]))
+
+    def reads(self, node, defined):
+        for name in read_names(node):
+            if name in self.containers:
+                raise CompileException('parallel for: %s is written by the loop and must not be read' % name)
+            if name in self.locals and name not in defined:
+                raise CompileException('parallel for: %s is read before it is assigned' % name)
+
+    def block(self, node, defined):
+        if isinstance(node, language.StatementList):
+            for statement in node.list:
+                self.block(statement, defined)
+        elif isinstance(node, language.Assignment):
+            self.reads(node.right, defined)
+            for sub in node.left.children():
+                self.reads(sub, defined)
+            left = node.left
+            if not left.subscriptions:
+                defined.add(left.name)
+            elif left.name in self.containers:
+                if len(left.subscriptions) != 1 or not mentions(left.subscriptions[0], self.varname):
+                    raise CompileException('parallel for: writes to %s must be indexed by %s' % (left.name, self.varname))
+            elif left.name not in defined:
+                raise CompileException('parallel for: %s is read before it is assigned' % left.name)
+            elif left.name not in self.fresh:
+                raise CompileException('parallel for: writes through %s may change shared values' % left.name)
+        elif isinstance(node, language.If):
+            self.reads(node.condition, defined)
+            self.block(node.block, set(defined))
+        elif isinstance(node, (language.Forloop, ParallelForloop)):
+            self.reads(node.iterable, defined)
+            self.block(node.block, defined | set([node.varname]))
+        else:
+            for child in node.children():
+                self.reads(child, defined)
+
+
+class WriteLog(object):
+    """Stands in for a shared container in a worker and records writes."""
+
+    def __init__(self, name):
+        self.name = name
+        self.writes = []
+
+    def __setitem__(self, key, value):
+        self.writes.append((self.name, key, value))
+
+
+# live parallel loops by id; inherited by the worker processes of _pool
+# when it is forked
+_loops = weakref.WeakValueDictionary()
+_pool = None
+# the worker count of _pool and the loops it knows, with their globals
+_pool_state = None
+# true in worker processes, where nested parallel loops run in sequence
+_in_worker = False
+
+
+def worker_started():
+    global _in_worker
+    _in_worker = True
+
+
+def run_chunk(task):
+    loop_id, snapshot, items = task
+    loop = _loops[loop_id]
+    return [run_iteration(loop, loop.pool_globals, snapshot, item) for item in items]
+
+
+def run_iteration(loop, global_objects, snapshot, item):
+    scope = dict(snapshot)
+    logs = [WriteLog(name) for name in loop.check.containers]
+    for log in logs:
+        scope[log.name] = log
+    env = Environment([scope, {loop.varname: item}])
+    for key, obj in global_objects.items():
+        env.globals.setdefault(key, obj)
+    output = []
+    env.stdout = output.append
+    loop.block.evaluate(env)
+    return output, [w for log in logs for w in log.writes]
+
+
+def get_pool(loop, workers):
+    """The shared pool, forked again if it does not know loop yet."""
+    global _pool, _pool_state
+    if _pool is not None:
+        known = _pool_state[1].get(id(loop))
+        if _pool_state[0] != workers or known is None or known[0]() is not loop or known[1] != loop.pool_globals:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+    if _pool is None:
+        _loops[id(loop)] = loop
+        # buffered output would be written again by every worker
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _pool = multiprocessing.Pool(workers, worker_started)
+        _pool_state = (workers, dict((key, (weakref.ref(l), l.pool_globals)) for key, l in _loops.items()))
+    return _pool
+
+
+class ParallelForloop(object):
+    """A for loop whose iterations run on a pool of worker processes.
+
+    Output and writes to shared containers are collected per iteration and
+    replayed in iteration order, so the result is the same as running the
+    iterations in sequence. The pool is shared by all parallel loops and
+    kept between evaluations. The namespace may be an Environment or a
+    plain dict.
+    """
+    workers = None
+    pool_globals = None
+
+    def __init__(self, varname, iterable, block):
+        self.varname = varname
+        self.iterable = iterable
+        self.block = block
+        self.check = BodyCheck(varname, block)
+        self.reads = set(read_names(block)) - self.check.locals - self.check.containers
+
+    def children(self):
+        return [self.iterable, self.block]
+
+    def evaluate(self, namespace):
+        if isinstance(namespace, Environment):
+            namespace.flush()
+            scopes, global_objects = namespace.stack, namespace.globals
+        elif isinstance(namespace, dict):
+            scopes, global_objects = [namespace], {}
+        else:
+            raise TypeError('parallel for needs an Environment or a dict as namespace, not %s' % type(namespace).__name__)
+        for name in self.check.locals:
+            if name != self.varname and (name in global_objects or any(name in scope for scope in scopes)):
+                raise ValueError('parallel for: %s is assigned by the loop but already defined' % name)
+        items = list(self.iterable.set_namespace(namespace).value)
+        snapshot = {}
+        for scope in scopes:
+            for name in self.reads:
+                if name in scope:
+                    snapshot[name] = scope[name]
+        workers = self.workers or multiprocessing.cpu_count()
+        if workers > 1 and len(items) > 1 and not _in_worker:
+            self.pool_globals = dict((k, v) for k, v in global_objects.items() if k not in STD_GLOBALS)
+            size = (len(items) + workers - 1) // workers
+            tasks = [(id(self), snapshot, items[i:i + size]) for i in range(0, len(items), size)]
+            results = [r for chunk in get_pool(self, workers).map(run_chunk, tasks) for r in chunk]
+        else:
+            results = [run_iteration(self, global_objects, snapshot, item) for item in items]
+        for output, writes in results:
+            for text in output:
+                namespace.stdout(text)
+            for name, key, value in writes:
+                namespace[name][key] = value
+
+
+# globals every Environment registers itself
+STD_GLOBALS = frozenset(Environment().globals)
@@ -2,6 +2,7 @@ from ply import yacc
 
 from .lexer import tokens
 from . import language
+from . import parallel
 from .exceptions import CompileException
 
 
@@ -25,6 +26,7 @@ def p_statement(p):
               | for_statement
               | nop
               | print
+              | import_statement
     '''
     p[0] = p[1]
 
@@ -34,11 +36,23 @@ def p_if_statement(p):
     p[0] = language.If(p[2], p[5])
 
 
+def constant_pool(p):
+    pool = getattr(p.lexer, 'constants', None)
+    if pool is None:
+        pool = p.lexer.constants = language.ConstantPool()
+    return pool
+
+
 def p_list(p):
     '''
     list : LSPAREN list_inner RSPAREN
+         | NUMBER_LIST
     '''
-    p[0] = p[2]
+    values = p[1] if len(p) == 2 else p[2]
+    if isinstance(values, list) and any(isinstance(v, language.Expression) for v in values):
+        p[0] = values
+    else:
+        p[0] = language.ListLiteral(constant_pool(p), values)
 
 
 def p_list_inner(p):
@@ -69,12 +83,19 @@ def p_for_statement(p):
     p[0] = language.Forloop(p[2], p[4], p[7])
 
 
+def p_parallel_for_statement(p):
+    '''
+    for_statement : PARALLEL FOR NAME IN expr NEWLINE START_BLOCK statement_list END_BLOCK
+    '''
+    p[0] = parallel.ParallelForloop(p[3], p[5], p[8])
+
+
 def p_assignment(p):
     '''assignment : variable ASSIGN expr'''
     if p[2] == '=':
         p[0] = language.Assignment(p[1], p[3])
     elif p[2] == '+=':
-        p[0] = language.Assignment(p[1], language.Addition(p[1], p[3]))
+        p[0] = language.AugmentedAssignment(p[1], language.Addition(p[1], p[3]))
     elif p[2] == '-=':
         p[0] = language.Assignment(p[1], language.Substraction(p[1], p[3]))
     elif p[2] == '*=':
@@ -160,6 +181,13 @@ def p_call(p):
     p[0] = language.Call(p[1], *p[3])
 
 
+def p_import_statement(p):
+    '''
+    import_statement : IMPORT NAME
+    '''
+    p[0] = language.Import(p[2])
+
+
 def p_print(p):
     '''
     print : PRINT expr
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import signal
+import socket
+from collections import OrderedDict
+
+from .parser import parser
+from .lexer import PLYCompatLexer, build_lexer
+from .environment import Environment
+from .exceptions import CompileException
+
+
+class ProgramCache(object):
+    """Parsed programs by source, so each script is parsed once per process.
+
+    Only the maxsize most recently used programs are kept.
+    """
+
+    def __init__(self, lexer=None, maxsize=256):
+        self.lexer = lexer or build_lexer()
+        self.maxsize = maxsize
+        self.programs = OrderedDict()
+
+    def get(self, code):
+        program = self.programs.pop(code, None)
+        if program is None:
+            program = parser.parse(code, lexer=PLYCompatLexer(lexer=self.lexer))
+        self.programs[code] = program
+        if len(self.programs) > self.maxsize:
+            self.programs.popitem(last=False)
+        return program
+
+
+class Server(object):
+    """Runs scripts sent over a unix domain socket.
+
+    The parser tables, a lexer and the program cache are built once in the
+    parent and inherited by the pre-forked workers, which all accept
+    on the same socket. A request is one json line with "code" and an
+    optional "namespace"; the reply is one json line per output of the
+    script ({"type": "std" or "error", "text": ...}) followed by
+    {"type": "result", "namespace": ...}. A request that cannot be run
+    gets an error message and the result; a worker that dies anyway is
+    replaced by serve_forever.
+    """
+
+    def __init__(self, path, workers=4, setup=None, preload=()):
+        self.path = path
+        self.workers = workers
+        self.setup = setup
+        self.cache = ProgramCache()
+        for code in preload:
+            self.cache.get(code)
+        self.pids = []
+        self.sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(128)
+        for i in range(self.workers):
+            self.spawn()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.work()
+            finally:
+                os._exit(0)
+        self.pids.append(pid)
+
+    def respawn(self):
+        """Wait for a worker to exit and start a new one in its place."""
+        pid, status = os.wait()
+        self.pids.remove(pid)
+        self.spawn()
+
+    def stop(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self.pids = []
+        self.sock.close()
+        os.unlink(self.path)
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                self.respawn()
+        finally:
+            self.stop()
+
+    def work(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        while True:
+            conn, address = self.sock.accept()
+            try:
+                self.handle(conn.makefile('r+b'))
+            except socket.error:
+                pass
+            finally:
+                conn.close()
+
+    def handle(self, stream):
+        def send(message):
+            stream.write(json.dumps(message, default=repr) + '\n')
+            stream.flush()
+
+        namespace = {}
+        try:
+            request = json.loads(stream.readline())
+            namespace = request.get('namespace') or {}
+            code = request['code']
+            env = Environment([namespace])
+            env.register_outhandler(lambda kind, text: send({'type': kind, 'text': text}))
+            if self.setup is not None:
+                self.setup(env)
+            try:
+                program = self.cache.get(code)
+            except CompileException as e:
+                env.stderr(str(e))
+            else:
+                if program is not None:
+                    env.evaluate_statement_list(program)
+            env.flush()
+        except socket.error:
+            raise
+        except (Exception, CompileException) as e:
+            # CompileException derives from BaseException
+            send({'type': 'error', 'text': '%s: %s' % (type(e).__name__, e)})
+        send({'type': 'result', 'namespace': namespace})
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description='Serve script executions on a unix domain socket.')
+    argparser.add_argument('-s', '--socket', required=True, help='path of the socket to listen on')
+    argparser.add_argument('-w', '--workers', type=int, default=4, help='number of worker processes')
+    args = argparser.parse_args(argv)
+    Server(args.socket, args.workers).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
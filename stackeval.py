@@ -0,0 +1,231 @@
+from . import language
+
+
+NOT_LEAF = object()
+
+
+class StackEvaluator(object):
+    """Evaluates a statement tree without recursing through python frames.
+
+    Pending work is kept on an explicit stack of (handler, node, extra)
+    items and intermediate results on a value stack, so arbitrarily deep
+    expression chains and block nesting run at constant python stack depth.
+    The result is the same as that of node.evaluate(namespace).
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.table = [
+            (language.StatementList, self.statement_list),
+            (language.AugmentedAssignment, self.augmented_assignment),
+            (language.Assignment, self.assignment),
+            (language.Nop, self.nop),
+            (language.PrintStatement, self.print_statement),
+            (language.If, self.if_statement),
+            (language.Forloop, self.forloop),
+            (language.TwoValueOperation, self.operation),
+            (language.Variable, self.variable),
+            (language.Call, self.call),
+            (language.ListLiteral, self.list_literal),
+            (language.Expression, self.expression),
+        ]
+
+    def handler(self, node):
+        cls = type(node)
+        handler = self.handlers.get(cls)
+        if handler is None:
+            handler = self.fallback
+            for base, h in self.table:
+                if issubclass(cls, base):
+                    handler = h
+                    break
+            self.handlers[cls] = handler
+        return handler
+
+    def evaluate(self, root, namespace):
+        self.namespace = namespace
+        self.values = []
+        self.work = [(self.handler(root), root, None)]
+        work = self.work
+        loop_depth = getattr(namespace, 'loop_depth', 0)
+        try:
+            while work:
+                handler, node, extra = work.pop()
+                handler(node, extra)
+        finally:
+            if getattr(namespace, 'loop_depth', 0) != loop_depth:
+                # loops left by an exception
+                namespace.loop_depth = loop_depth + 1
+                namespace.leave_loop()
+            self.namespace = self.values = self.work = None
+
+    def push(self, node):
+        self.work.append((self.handler(node), node, None))
+
+    def fallback(self, node, extra):
+        # nodes without a handler use their own evaluate or value
+        if hasattr(node, 'evaluate'):
+            node.evaluate(self.namespace)
+        else:
+            self.values.append(node.set_namespace(self.namespace).value)
+
+    # statements
+
+    def statement_list(self, node, extra):
+        for statement in reversed(node.list):
+            self.push(statement)
+
+    def assignment(self, node, extra):
+        left = node.left
+        if not left.subscriptions:
+            value = self.leaf(node.right)
+            if value is not NOT_LEAF:
+                left.store(self.namespace, (), value)
+                return
+        self.work.append((self.store, left, None))
+        self.subscriptions(left)
+        self.push(node.right)
+
+    def augmented_assignment(self, node, extra):
+        if not node.accumulates(self.namespace):
+            return self.assignment(node, extra)
+        self.work.append((self.accumulate, node, None))
+        self.push(node.right.right)
+
+    def accumulate(self, node, extra):
+        self.namespace.accumulate(node.left.name, self.values.pop())
+
+    def store(self, node, extra):
+        indices = self.pop_indices(node)
+        node.store(self.namespace, indices, self.values.pop())
+
+    def nop(self, node, extra):
+        pass
+
+    def print_statement(self, node, extra):
+        self.work.append((self.print_value, node, None))
+        self.push(node.expr)
+
+    def print_value(self, node, extra):
+        self.namespace.stdout(self.values.pop())
+
+    def if_statement(self, node, extra):
+        self.work.append((self.if_branch, node, None))
+        self.push(node.condition)
+
+    def if_branch(self, node, extra):
+        if self.values.pop():
+            self.push(node.block)
+
+    def forloop(self, node, extra):
+        if node.compiled is not None:
+            return node.compiled(self.namespace)
+        self.work.append((self.forloop_start, node, None))
+        self.push(node.iterable)
+
+    def forloop_start(self, node, extra):
+        iterator = iter(self.values.pop())
+        self.namespace.enter_loop()
+        self.forloop_next(node, iterator)
+
+    def forloop_next(self, node, iterator):
+        for var in iterator:
+            self.namespace.push_stacklevel()
+            self.namespace.set_local_key(node.varname, var)
+            self.work.append((self.forloop_next, node, iterator))
+            self.work.append((self.forloop_end_iteration, node, None))
+            self.push(node.block)
+            return
+        self.namespace.leave_loop()
+        if node.tiering is not None:
+            node.tiering.loop_finished(node)
+
+    def forloop_end_iteration(self, node, extra):
+        self.namespace.pop_stacklevel()
+        node.iterations += 1
+
+    # expressions
+
+    def expression(self, node, extra):
+        sub_expr = node.sub_expr
+        if isinstance(sub_expr, language.Variable):
+            self.push(sub_expr)
+        elif type(sub_expr) in (int, unicode, str, list):
+            self.values.append(sub_expr)
+        else:
+            raise TypeError('cant get value of %s' % type(sub_expr))
+
+    def leaf(self, node):
+        """Value of a literal or unsubscripted variable, NOT_LEAF otherwise."""
+        cls = type(node)
+        if cls is language.Variable:
+            if not node.subscriptions:
+                return node.lookup(self.namespace, ())
+        elif cls is language.Expression:
+            sub_expr = node.sub_expr
+            if type(sub_expr) is int or type(sub_expr) is str:
+                return sub_expr
+        return NOT_LEAF
+
+    def list_literal(self, node, extra):
+        self.values.append(node.value)
+
+    def operation(self, node, extra):
+        # operands that are leaves are evaluated right away instead of
+        # going through the work stack
+        left = self.leaf(node.left)
+        if left is not NOT_LEAF:
+            right = self.leaf(node.right)
+            if right is not NOT_LEAF:
+                self.values.append(node.compute(left, right))
+                return
+            self.values.append(left)
+            self.work.append((self.apply, node, None))
+            self.push(node.right)
+            return
+        self.work.append((self.apply, node, None))
+        self.push(node.right)
+        self.push(node.left)
+
+    def apply(self, node, extra):
+        right = self.values.pop()
+        left = self.values.pop()
+        self.values.append(node.compute(left, right))
+
+    def subscriptions(self, node):
+        for sub in reversed(node.subscriptions):
+            if isinstance(sub, language.Expression):
+                self.push(sub)
+            else:
+                self.work.append((self.constant, sub, None))
+
+    def constant(self, node, extra):
+        self.values.append(node)
+
+    def pop_indices(self, node):
+        count = len(node.subscriptions)
+        if not count:
+            return ()
+        indices = self.values[-count:]
+        del self.values[-count:]
+        return indices
+
+    def variable(self, node, extra):
+        self.work.append((self.load, node, None))
+        self.subscriptions(node)
+
+    def load(self, node, extra):
+        indices = self.pop_indices(node)
+        self.values.append(node.lookup(self.namespace, indices))
+
+    def call(self, node, extra):
+        self.work.append((self.call_function, node, None))
+        self.push(node.function)
+
+    def call_function(self, node, extra):
+        self.values.append(self.values.pop()(*node.arguments(self.namespace)))
+
+
+def evaluate(root, namespace):
+    """Evaluate root in namespace with a StackEvaluator."""
+    StackEvaluator().evaluate(root, namespace)
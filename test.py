@@ -1,5 +1,12 @@
 #!/usr/bin/env python
+import json
+import os
+import shutil
+import signal
+import socket
+import tempfile
 import unittest
+from array import array
 from mock import Mock
 
 if __name__ == '__main__':
@@ -10,8 +17,17 @@ if __name__ == '__main__':
 
 from .parser import parser
 from .lexer import PLYCompatLexer
-from .exceptions import CompileException
+from .exceptions import CompileException, ReadOnlyGlobal
 from .environment import Environment
+from .language import TypeProfile, specialization_stats
+from .codegen import compile_tree
+from .tiering import TieredRunner
+from .server import Server, ProgramCache
+from . import client
+from . import stackeval
+from . import parallel
+from .modules import ModuleLoader
+from .incremental import IncrementalProgram
 
 
 class TestBase(unittest.TestCase):
@@ -267,6 +283,615 @@ class TestFunctions(TestBase):
         self.assertEqual(n, Environment([{'b': 2}]))
 
 
+class TestSpecialization(TestBase):
+    def stats(self, root, kind):
+        return [s for s in specialization_stats(root) if s['kind'] == kind]
+
+    def test_int_site(self):
+        root = self.compile('''a=0\nfor i in b\n a=a+i''')
+        n = Environment([{'b': range(TypeProfile.warmup + 2)}])
+        root.evaluate(n)
+        self.assertEqual(n['a'], sum(n['b']))
+        self.assertEqual(self.stats(root, 'Addition')[0]['state'], 'int')
+
+    def test_str_site(self):
+        root = self.compile('''a=""\nfor i in b\n a=a+i''')
+        n = Environment([{'b': ['x'] * (TypeProfile.warmup + 2)}])
+        root.evaluate(n)
+        self.assertEqual(n['a'], 'x' * (TypeProfile.warmup + 2))
+        self.assertEqual(self.stats(root, 'Addition')[0]['state'], 'str')
+
+    def test_polymorphic_site_stays_generic(self):
+        root = self.compile('''a=b*c''')
+        for b, c in [(2, 3), ('x', 3)] * TypeProfile.warmup:
+            root.evaluate({'b': b, 'c': c})
+        self.assertEqual(self.stats(root, 'Multiplication')[0]['state'], 'generic')
+
+    def test_deoptimize(self):
+        root = self.compile('''c=a+b''')
+        for i in range(TypeProfile.warmup):
+            root.evaluate({'a': i, 'b': 1})
+        n = {'a': 'x', 'b': 'y'}
+        root.evaluate(n)
+        self.assertEqual(n['c'], 'xy')
+        stats = self.stats(root, 'Addition')[0]
+        self.assertEqual(stats['state'], 'generic')
+        self.assertEqual(stats['deopts'], 1)
+
+    def test_specialized_operands(self):
+        root = self.compile('''c=a[0]*2-b''')
+        for i in range(TypeProfile.warmup + 2):
+            n = {'a': [i], 'b': 1}
+            root.evaluate(n)
+            self.assertEqual(n['c'], i * 2 - 1)
+        self.assertEqual([s['state'] for s in self.stats(root, 'Multiplication') + self.stats(root, 'Substraction')], ['int', 'int'])
+
+    def test_variable_site(self):
+        root = self.compile('''c=a''')
+        for i in range(TypeProfile.warmup):
+            root.evaluate({'a': i})
+        stats = self.stats(root, 'Variable')[-1]
+        self.assertEqual((stats['state'], stats['types']), ('profiled', {'int': TypeProfile.warmup}))
+
+    def test_deep_chain_stats(self):
+        root = self.compile('b=' + '+'.join(['a'] * 3000))
+        stats = self.stats(root, 'Addition')
+        self.assertEqual(len(stats), 2999)
+        self.assertTrue(stats[0]['site'].startswith('(...) + a '))
+
+
+class TestCodegen(TestBase):
+    def run_compiled(self, code, namespace):
+        compile_tree(self.compile(code))(namespace)
+        return namespace
+
+    def test_same_result(self):
+        code = '''a=(2+2)*5/3-1\nb=[1,2]\nb[0]=a\nfor i in b\n if i\n  c=i'''
+        self.assertEqual(self.run_compiled(code, Environment()), self.run_code(code, Environment()))
+
+    def test_print_and_call(self):
+        env = Environment()
+        env.stdout = Mock()
+        self.run_compiled('''a="x"\nprint len(a)''', env)
+        env.stdout.assert_called_with(1)
+
+
+class TestTiering(TestBase):
+    def test_program_promotion(self):
+        runner = TieredRunner(program_threshold=2, background=False)
+        root = self.compile('''a=a+1''')
+        n = {'a': 0}
+        for i in range(4):
+            runner.run(root, n)
+        self.assertEqual(n, {'a': 4})
+        self.assertEqual(runner.metrics['program_promotions'], 1)
+        self.assertEqual(runner.metrics['interpreted_runs'], 2)
+        self.assertEqual(runner.metrics['compiled_runs'], 2)
+
+    def test_loop_promotion(self):
+        runner = TieredRunner(loop_threshold=3)
+        root = self.compile('''for i in b\n a=a+i''')
+        env = Environment([{'a': 0, 'b': [1, 2, 3]}])
+        runner.run(root, env)
+        runner.wait()
+        self.assertEqual(runner.metrics['loop_promotions'], 1)
+        self.assertIsNotNone(root.list[0].compiled)
+        runner.run(root, env)
+        self.assertEqual(env['a'], 12)
+        self.assertEqual(runner.metrics['compiled_loop_runs'], 1)
+        self.assertEqual(runner.metrics['interpreted_runs'], 2)
+
+    def test_failed_promotion(self):
+        runner = TieredRunner()
+        root = self.compile('b=' + '+'.join(['a'] * 3000))
+        state = {'runs': 0, 'compiled': None}
+        runner.promote(runner.promote_program, root, state)
+        runner.wait()
+        self.assertIsNone(state['compiled'])
+        self.assertEqual(runner.metrics['failed_promotions'], 1)
+        self.assertEqual(runner.metrics['program_promotions'], 0)
+
+
+class TestParallelForloop(TestBase):
+    def test_indexed_results(self):
+        root = self.compile('''parallel for i in b\n t=i*f\n r[i]=t''')
+        root.list[0].workers = 2
+        n = Environment([{'b': [0, 1, 2, 3], 'f': 3, 'r': {}}])
+        root.evaluate(n)
+        self.assertEqual(n['r'], {0: 0, 1: 3, 2: 6, 3: 9})
+
+    def test_pool_reused(self):
+        root = self.compile('''parallel for i in b\n r[i]=i*f''')
+        root.list[0].workers = 2
+        root.evaluate({'b': [0, 1, 2], 'f': 2, 'r': {}})
+        pool = parallel._pool
+        for f in (3, 4):
+            n = {'b': [0, 1, 2], 'f': f, 'r': {}}
+            root.evaluate(n)
+            self.assertEqual(n['r'], {0: 0, 1: f, 2: 2 * f})
+        self.assertIs(parallel._pool, pool)
+
+    def test_namespace_type(self):
+        root = self.compile('''parallel for i in b\n r[i]=i''')
+        with self.assertRaises(TypeError):
+            root.evaluate(Mock())
+
+    def test_in_process(self):
+        root = self.compile('''parallel for i in b\n r[i]=i+1''')
+        root.list[0].workers = 1
+        n = Environment([{'b': [0, 1], 'r': [0, 0]}])
+        root.evaluate(n)
+        self.assertEqual(n['r'], [1, 2])
+
+    def test_print_order(self):
+        env = Environment([{'b': range(8)}])
+        env.stdout = Mock()
+        self.run_code('''parallel for i in b\n print i''', env)
+        self.assertEqual([c[0][0] for c in env.stdout.call_args_list], range(8))
+
+    def test_reject_outer_scalar(self):
+        with self.assertRaises(CompileException):
+            self.compile('''parallel for i in b\n a=a+i''')
+        with self.assertRaises(ValueError):
+            self.run_code('''a=0\nparallel for i in b\n a=i''', Environment([{'b': [1]}]))
+        env = Environment([{'b': [1]}])
+        env.stderr = Mock()
+        env.evaluate_statement_list(self.compile('''a=0\nparallel for i in b\n a=i'''))
+        env.stderr.assert_called_once()
+
+    def test_reject_aliased_local_write(self):
+        with self.assertRaises(CompileException):
+            self.compile('''parallel for i in b\n d=s[i]\n d[0]=i''')
+        with self.assertRaises(CompileException):
+            self.compile('''parallel for i in b\n for d in s\n  d[0]=i''')
+        root = self.compile('''parallel for i in b\n d=[0,0]\n d[1]=i\n r[i]=d''')
+        n = {'b': [0, 1], 'r': {}}
+        root.evaluate(n)
+        self.assertEqual(n['r'], {0: [0, 0], 1: [0, 1]})
+
+    def test_reject_unindexed_write(self):
+        with self.assertRaises(CompileException):
+            self.compile('''parallel for i in b\n r[0]=i''')
+        with self.assertRaises(CompileException):
+            self.compile('''parallel for i in b\n r[i]=r[0]''')
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'socket')
+        self.server = Server(self.path, workers=2)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        os.rmdir(self.dir)
+
+    def test_run(self):
+        out = Mock()
+        n = client.run(self.path, '''b=a+1\nprint b''', {'a': 1}, out)
+        self.assertEqual(n, {'a': 1, 'b': 2})
+        out.assert_called_once_with('std', 2)
+
+    def test_errors(self):
+        out = Mock()
+        n = client.run(self.path, '''b=a''', {}, out)
+        self.assertEqual(n, {})
+        self.assertEqual(out.call_args[0][0], 'error')
+        client.run(self.path, '''a=$''', {}, out)
+        self.assertEqual(out.call_args[0][0], 'error')
+
+    def send_raw(self, line):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        try:
+            stream = sock.makefile('r+b')
+            stream.write(line)
+            stream.flush()
+            return [json.loads(l) for l in stream]
+        finally:
+            sock.close()
+
+    def test_invalid_requests(self):
+        for line in ('not json\n', '{"namespace": {}}\n', '[]\n'):
+            messages = self.send_raw(line)
+            self.assertEqual([m['type'] for m in messages], ['error', 'result'])
+        self.assertEqual(client.run(self.path, '''a=1'''), {'a': 1})
+
+    def test_failing_setup(self):
+        self.server.setup = Mock(side_effect=ValueError('broken'))
+        self.server.stop()
+        self.server.start()
+        out = Mock()
+        for i in range(3):
+            client.run(self.path, '''a=1''', {}, out)
+        out.assert_called_with('error', 'ValueError: broken')
+
+    def test_language_errors(self):
+        frozen = Mock()
+        frozen.__setitem__ = Mock(side_effect=ReadOnlyGlobal('frozen is read only'))
+        self.server.setup = lambda env: env.register_global('frozen', frozen)
+        self.server.stop()
+        self.server.start()
+        out = Mock()
+        for i in range(3):
+            self.assertEqual(client.run(self.path, '''a=1\nfrozen.x=1''', {}, out), {'a': 1})
+            out.assert_called_with('error', 'frozen is read only')
+        self.server.setup = Mock(side_effect=CompileException('broken'))
+        self.server.stop()
+        self.server.start()
+        for i in range(3):
+            client.run(self.path, '''a=1''', {}, out)
+            out.assert_called_with('error', 'CompileException: broken')
+
+    def test_module_writes(self):
+        modules = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(modules, 'helpers.dsl'), 'w') as f:
+                f.write('''x=2''')
+            self.server.setup = lambda env: setattr(env, 'loader', ModuleLoader([modules]))
+            self.server.stop()
+            self.server.start()
+            out = Mock()
+            for i in range(3):
+                self.assertEqual(client.run(self.path, '''import helpers\na=helpers.x\nhelpers.x=1''', {}, out), {'a': 2})
+                out.assert_called_with('error', 'module helpers is read only')
+        finally:
+            shutil.rmtree(modules)
+
+    def test_respawn(self):
+        os.kill(self.server.pids[0], signal.SIGKILL)
+        self.server.respawn()
+        self.assertEqual(len(self.server.pids), 2)
+        for i in range(3):
+            self.assertEqual(client.run(self.path, '''a=1'''), {'a': 1})
+
+    def test_cache_bounded(self):
+        cache = ProgramCache(maxsize=2)
+        for code in ('a=1', 'a=2', 'a=1', 'a=3'):
+            cache.get(code)
+        self.assertEqual(list(cache.programs), ['a=1', 'a=3'])
+
+
+class TestStackEvaluator(TestBase):
+    def run_both(self, code, stack):
+        root = self.compile(code)
+        n = Environment([dict(stack)])
+        root.evaluate(n)
+        m = Environment([dict(stack)])
+        stackeval.evaluate(root, m)
+        self.assertEqual(n, m)
+        return m
+
+    def test_same_result(self):
+        n = self.run_both('''a=(2+2)*5/3-1\nb=[1,2]\nb[0]=a\nd.x=b[1]\nfor i in b\n if i\n  c=i''', {'d': {}})
+        self.assertEqual(n['d'], {'x': 2})
+        self.run_both('''r=0\nfor i in b\n for j in b\n  r=r+i*j''', {'b': [1, 2, 3]})
+
+    def test_print_and_call(self):
+        env = Environment()
+        env.stdout = Mock()
+        stackeval.evaluate(self.compile('''a="x"\nprint len(a)'''), env)
+        env.stdout.assert_called_with(1)
+
+    def test_deep_chain(self):
+        n = Environment([{'a': 1}])
+        stackeval.evaluate(self.compile('b=' + '+'.join(['a'] * 20000)), n)
+        self.assertEqual(n['b'], 20000)
+
+    def test_deep_blocks(self):
+        depth = 1200
+        code = '\n'.join(' ' * level + 'if a' for level in range(depth)) + '\n' + ' ' * depth + 'b=a'
+        n = Environment([{'a': 1}])
+        stackeval.evaluate(self.compile(code), n)
+        self.assertEqual(n['b'], 1)
+
+
+class TestAccumulation(TestBase):
+    def test_string(self):
+        n = self.run_code('''s=""\nfor i in b\n s+=i''', Environment([{'b': ['x', 'y', 'z']}]))
+        self.assertEqual(n, Environment([{'b': ['x', 'y', 'z'], 's': 'xyz'}]))
+        self.assertEqual(type(n.stack[0]['s']), str)
+
+    def test_list_alias_unchanged(self):
+        n = self.run_code('''a=c\nfor i in b\n a+=i''', Environment([{'b': [[1], [2]], 'c': [0]}]))
+        self.assertEqual(n['a'], [0, 1, 2])
+        self.assertEqual(n['c'], [0])
+
+    def test_read_between_appends(self):
+        n = self.run_code('''s="a"\ns+="b"\nt=s\ns+="c"\nu=s+t''', Environment())
+        self.assertEqual(n, Environment([{'s': 'abc', 't': 'ab', 'u': 'abcab'}]))
+
+    def test_mixed_types(self):
+        with self.assertRaises(TypeError):
+            self.run_code('''s="a"\ns+="b"\ns+=1''', Environment())
+        n = self.run_code('''a=1\na+=2''', Environment())
+        self.assertEqual(n['a'], 3)
+
+    def test_stack_evaluator(self):
+        n = Environment([{'b': ['x', 'y']}])
+        stackeval.evaluate(self.compile('''s=""\nfor i in b\n s+=i'''), n)
+        self.assertEqual(n['s'], 'xy')
+
+    def test_flushed_after_run(self):
+        n = Environment([{'b': ['x', 'y']}])
+        n.evaluate_statement_list(self.compile('''s=""\nfor i in b\n s+=i'''))
+        self.assertEqual(n.stack[0]['s'], 'xy')
+
+    def test_scope_dict(self):
+        n = Environment([{'s': 'a'}])
+        self.run_code('''d=sys.locals\ns+="b"\nx=d.s\ns+="c"''', n)
+        self.assertEqual(n['x'], 'ab')
+        self.assertEqual(n['s'], 'abc')
+
+    def test_compiled(self):
+        n = Environment([{'b': ['x', 'y'], 's': ''}])
+        compile_tree(self.compile('''for i in b\n s+=i'''))(n)
+        self.assertIs(type(n.stack[0]['s']), str)
+        self.assertEqual(n['s'], 'xy')
+
+    def test_materialized_after_loops(self):
+        code = '''t="a"\nt+="b"\ns=""\nl=[0]\nfor i in b\n for j in b\n  s+=j\n  l+=[1]'''
+        runner = TieredRunner(program_threshold=1, loop_threshold=2, background=False)
+        tiered = self.compile(code)
+        for run in (self.compile(code).evaluate, lambda n: stackeval.evaluate(self.compile(code), n),
+                    lambda n: runner.run(tiered, n), lambda n: runner.run(tiered, n)):
+            n = Environment([{'b': ['x', 'y']}])
+            run(n)
+            self.assertEqual(n.stack[0], {'b': ['x', 'y'], 's': 'xyxy', 'l': [0, 1, 1, 1, 1], 't': 'ab'})
+        self.assertEqual(runner.metrics['program_promotions'], 1)
+
+
+class TestModules(TestBase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loader = ModuleLoader([self.dir])
+        self.write('''x=2\ny=[1,2]''')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, code, mtime=None):
+        filename = os.path.join(self.dir, 'helpers.dsl')
+        with open(filename, 'w') as f:
+            f.write(code)
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+
+    def test_import(self):
+        n = self.run_code('''import helpers\na=helpers.x+1''', Environment(loader=self.loader))
+        self.assertEqual(n, Environment([{'a': 3}]))
+
+    def test_shared_and_lazy(self):
+        a = Environment(loader=self.loader)
+        b = Environment(loader=self.loader)
+        self.run_code('''import helpers''', a)
+        self.run_code('''import helpers''', b)
+        self.assertIs(a['helpers'], b['helpers'])
+        self.assertIsNone(a['helpers'].env)
+        self.run_code('''c=helpers.y[1]''', b)
+        self.assertEqual(b['c'], 2)
+        self.assertIsNotNone(a['helpers'].env)
+
+    def test_read_only(self):
+        with self.assertRaises(ReadOnlyGlobal):
+            self.run_code('''import helpers\nhelpers.x=1''', Environment(loader=self.loader))
+        with self.assertRaises(ReadOnlyGlobal):
+            self.run_code('''import helpers\nhelpers.y[0]=99''', Environment(loader=self.loader))
+        n = self.run_code('''import helpers\na=helpers.y[0]\nb=helpers.y+[3]''', Environment(loader=self.loader))
+        self.assertEqual((n['a'], n['b']), (1, [1, 2, 3]))
+        with self.assertRaises(KeyError):
+            self.run_code('''import helpers\na=helpers.sys.globals''', Environment(loader=self.loader))
+        with self.assertRaises(ReadOnlyGlobal):
+            n['helpers'].env.stack[0]['x'] = 1
+
+    def test_imported_module(self):
+        with open(os.path.join(self.dir, 'outer.dsl'), 'w') as f:
+            f.write('''import helpers\nz=helpers.x''')
+        n = self.run_code('''import outer\na=outer.helpers.x+outer.z''', Environment(loader=self.loader))
+        self.assertEqual(n['a'], 4)
+
+    def test_deeply_nested(self):
+        depth = 22
+        code = '''y=[1]\nz=0\n''' + '\n'.join(' ' * level + 'for v%s in y' % chr(97 + level) for level in range(depth))
+        self.write(code + '\n' + ' ' * depth + 'z+=1')
+        n = self.run_code('''import helpers\na=helpers.z''', Environment(loader=self.loader))
+        self.assertEqual(n['a'], 1)
+
+    def test_import_cycle(self):
+        with open(os.path.join(self.dir, 'first.dsl'), 'w') as f:
+            f.write('''import second\ny=1\nx=second.x''')
+        with open(os.path.join(self.dir, 'second.dsl'), 'w') as f:
+            f.write('''import first\nx=first.y''')
+        with self.assertRaises(ImportError):
+            self.run_code('''import first\na=first.x''', Environment(loader=self.loader))
+
+    def test_invalidation(self):
+        first = self.loader.load('helpers')
+        self.write('''x=2\ny=[1,2]''', mtime=1)
+        self.assertIs(self.loader.load('helpers'), first)
+        self.write('''x=3''', mtime=2)
+        self.assertEqual(self.loader.load('helpers')['x'], 3)
+
+    def test_not_found(self):
+        with self.assertRaises(ImportError):
+            self.run_code('''import other''', Environment(loader=self.loader))
+
+
+class TestPureGlobals(TestBase):
+    def test_cached(self):
+        f = Mock(side_effect=lambda x, y: x * y)
+        e = Environment([{'b': [1, 2, 1, 2]}])
+        e.register_pure_global('f', f)
+        n = self.run_code('''c=0\nfor i in b\n c=c+f(i, 3)''', e)
+        self.assertEqual(n['c'], 18)
+        self.assertEqual(f.call_count, 2)
+        stats = n.cache_stats()['f']
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_lru_eviction(self):
+        f = Mock(side_effect=lambda x: x)
+        e = Environment()
+        e.register_pure_global('f', f, maxsize=1)
+        self.run_code('''a=f(1)\na=f(2)\na=f(1)''', e)
+        self.assertEqual(f.call_count, 3)
+        self.assertEqual(e.cache_stats()['f']['evictions'], 2)
+
+    def test_ttl(self):
+        f = Mock(return_value=1)
+        e = Environment()
+        e.register_pure_global('f', f, ttl=0)
+        self.run_code('''a=f(1)\na=f(1)''', e)
+        self.assertEqual(f.call_count, 2)
+
+    def test_unhashable(self):
+        f = Mock(return_value=1)
+        e = Environment([{'l': [1]}])
+        e.register_pure_global('f', f)
+        self.run_code('''a=f(l)\na=f(l)''', e)
+        f.assert_called_with([1])
+        self.assertEqual(f.call_count, 2)
+        self.assertEqual(e.cache_stats()['f']['uncacheable'], 2)
+
+    def test_shared(self):
+        f = Mock(return_value=1)
+        envs = [Environment() for i in range(3)]
+        for e in envs:
+            e.register_pure_global('f', f, shared=True)
+            self.run_code('''a=f(1)''', e)
+        self.assertEqual(f.call_count, 1)
+        self.assertEqual(envs[-1].cache_stats()['f']['hits'], 2)
+        e = Environment()
+        e.register_pure_global('f', f, maxsize=1, shared=True)
+        self.run_code('''a=f(1)''', e)
+        self.assertEqual(f.call_count, 2)
+        self.assertEqual(e.globals['f'].cache.maxsize, 1)
+
+    def test_mutable_result(self):
+        e = Environment()
+        e.register_pure_global('f', lambda x: [x])
+        self.run_code('''a=f(1)\na[0]=9\nb=f(1)''', e)
+        self.assertEqual((e['a'], e['b']), ([9], [1]))
+
+    def test_caller_namespace(self):
+        e = Environment([{'b': [0, 1, 2], 'r': {}}])
+        e.register_pure_global('f', lambda x: x * 2)
+        root = self.compile('''parallel for i in b\n r[i]=f(i)''')
+        root.list[0].workers = 2
+        root.evaluate(e)
+        self.assertEqual(e['r'], {0: 0, 1: 2, 2: 4})
+        e = Environment([{'b': [1, 2]}])
+        e.register_pure_global('f', lambda x: x * 2)
+        compile_tree(self.compile('''c=0\nfor i in b\n c=c+f(i)'''))(e)
+        self.assertEqual(e['c'], 6)
+
+
+class TestIncremental(TestBase):
+    def check(self, code, inputs, changes):
+        program = IncrementalProgram(self.compile(code))
+        env = Environment([dict(inputs)])
+        program.run(env)
+        executed = program.update(env, changes)
+        inputs.update(changes)
+        self.assertEqual(env, self.run_code(code, Environment([inputs])))
+        return executed
+
+    def test_only_affected(self):
+        code = '''a=x+1\nb=y*2\nc=a+b\nd=b'''
+        self.assertEqual(self.check(code, {'x': 1, 'y': 2}, {'x': 5}), [0, 2])
+        self.assertEqual(self.check(code, {'x': 1, 'y': 2}, {'y': 5}), [1, 2, 3])
+
+    def test_redefined_names(self):
+        code = '''a=1\na=a+c\nb=a'''
+        self.assertEqual(self.check(code, {'c': 1}, {'c': 2}), [1, 2])
+
+    def test_in_place_writes(self):
+        code = '''r=[0,0]\nr[0]=r[0]+x\nfor i in l\n r[1]=r[1]+i'''
+        self.assertEqual(self.check(code, {'x': 1, 'l': [1, 2]}, {'x': 3}), [0, 1, 2])
+
+    def test_aliasing(self):
+        code = '''r=[0]\ns=r\ns[0]=x\nb=r[0]'''
+        program = IncrementalProgram(self.compile(code))
+        env = Environment([{'x': 5}])
+        program.run(env)
+        self.assertEqual(env['b'], 5)
+        self.assertEqual(self.check(code, {'x': 5}, {'x': 7}), [0, 1, 2, 3])
+
+    def test_shared_values_not_copied(self):
+        code = '''a=l\nb=y*2\nc=a'''
+        l = [1]
+        program = IncrementalProgram(self.compile(code))
+        env = Environment([{'l': l, 'y': 1}])
+        program.run(env)
+        self.assertEqual(program.update(env, {'y': 2}), [1])
+        self.assertIs(env['c'], l)
+
+    def test_side_effects_rerun(self):
+        code = '''a=x\nprint y\nc=g(y)'''
+        program = IncrementalProgram(self.compile(code))
+        env = Environment([{'x': 1, 'y': 2}])
+        env.stdout = Mock()
+        env.register_pure_global('g', lambda y: y)
+        program.run(env)
+        self.assertEqual(program.update(env, {'x': 2}), [0, 1])
+        self.assertEqual(env.stdout.call_count, 2)
+
+    def test_impure_calls(self):
+        def f(a):
+            value = a.value
+            value.append(1)
+            return len(value)
+        code = '''a=[0]\nn=f(a)\nm=x'''
+        program = IncrementalProgram(self.compile(code))
+        env = Environment([{'x': 1}])
+        env.register_global('f', f)
+        program.run(env)
+        for x in (2, 3):
+            self.assertEqual(program.update(env, {'x': x}), [0, 1, 2])
+        full = Environment([{'x': 3}])
+        full.register_global('f', f)
+        self.assertEqual(env, self.run_code(code, full))
+        self.assertEqual((env['a'], env['n']), ([0, 1], 2))
+
+
+class TestListLiterals(TestBase):
+    def test_fresh_list_per_evaluation(self):
+        root = self.compile('''a=[1,2]\na[0]=5''')
+        root.evaluate({})
+        n = {}
+        root.evaluate(n)
+        self.assertEqual(n, {'a': [5, 2]})
+
+    def test_pool(self):
+        root = self.compile('''a=[1, 2, 3]\nb=["x",1]\nc=[1,2,3]\nd=[4]''')
+        pool = root.list[0].right.pool
+        self.assertEqual(len(pool), 3)
+        self.assertEqual(type(pool[0]), array)
+        self.assertEqual(pool[1], ('x', 1))
+        n = {}
+        root.evaluate(n)
+        self.assertEqual(n, {'a': [1, 2, 3], 'b': ['x', 1], 'c': [1, 2, 3], 'd': [4]})
+        self.assertIsNot(n['a'], n['c'])
+
+    def test_mixed_number_list(self):
+        n = self.run_code('''a=[1, 2,"x"]\nb=[1,2,b]''', {'b': 3})
+        self.assertEqual(n['a'], [1, 2, 'x'])
+        with self.assertRaises(CompileException):
+            self.compile('''a=[1,2,]''')
+
+    def test_subscription_unaffected(self):
+        n = self.run_code('''a=[1,2]\nb=a[1]''')
+        self.assertEqual(n['b'], 2)
+        with self.assertRaises(CompileException):
+            self.compile('''b=a[1,2]''')
+
+    def test_large_literal(self):
+        values = range(100000)
+        n = self.run_code('a=[%s]' % ','.join(str(v) for v in values))
+        self.assertEqual(n['a'], values)
+
+
 class TestErrorMessages(TestBase):
     def run_code_and_catch_errors(self, code):
         env = Environment()
@@ -0,0 +1,135 @@
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+from . import language
+from .codegen import compile_tree
+
+
+class TieredRunner(object):
+    """Runs programs on the tree walker and promotes hot ones to code
+    generated by codegen.
+
+    A program is promoted once it was run program_threshold times, a single
+    Forloop once it ran loop_threshold iterations in total. Promotion
+    happens on a background thread unless background is False; runs that
+    start after it finished use the compiled version. A tree that cannot be
+    compiled (for example one nested too deeply) stays interpreted and is
+    counted in failed_promotions.
+
+    Time spent in compiled loops is counted as compiled_loop_time, not as
+    part of the interpreted run around them.
+    """
+
+    def __init__(self, program_threshold=10, loop_threshold=1000, background=True):
+        self.program_threshold = program_threshold
+        self.loop_threshold = loop_threshold
+        self.background = background
+        self.programs = WeakKeyDictionary()
+        self.pending = []
+        self.lock = threading.Lock()
+        # compiled loop time of the runs in progress, per thread
+        self.local = threading.local()
+        self.failures = []
+        self.metrics = {
+            'program_promotions': 0,
+            'loop_promotions': 0,
+            'failed_promotions': 0,
+            'interpreted_runs': 0,
+            'compiled_runs': 0,
+            'compiled_loop_runs': 0,
+            'interpreted_time': 0.0,
+            'compiled_time': 0.0,
+            'compiled_loop_time': 0.0,
+            'compile_time': 0.0,
+        }
+
+    def run(self, statement_list, namespace):
+        state = self.programs.get(statement_list)
+        if state is None:
+            state = self.programs[statement_list] = {'runs': 0, 'compiled': None}
+            for node in language.walk(statement_list):
+                if isinstance(node, language.Forloop):
+                    node.tiering = self
+        compiled = state['compiled']
+        loop_time = getattr(self.local, 'loop_time', 0.0)
+        start = time.time()
+        try:
+            if compiled is not None:
+                compiled(namespace)
+            else:
+                statement_list.evaluate(namespace)
+        finally:
+            elapsed = time.time() - start - (getattr(self.local, 'loop_time', 0.0) - loop_time)
+            tier = 'compiled' if compiled is not None else 'interpreted'
+            with self.lock:
+                self.metrics[tier + '_runs'] += 1
+                self.metrics[tier + '_time'] += elapsed
+        if compiled is None:
+            state['runs'] += 1
+            if state['runs'] == self.program_threshold:
+                self.promote(self.promote_program, statement_list, state)
+
+    def loop_finished(self, loop):
+        if loop.iterations >= self.loop_threshold and loop.tiering is self:
+            # only promote once
+            loop.tiering = None
+            self.promote(self.promote_loop, loop)
+
+    def promote(self, function, *args):
+        if not self.background:
+            return function(*args)
+        thread = threading.Thread(target=function, args=args)
+        thread.daemon = True
+        with self.lock:
+            self.pending.append(thread)
+        thread.start()
+
+    def compile(self, node):
+        start = time.time()
+        try:
+            compiled = compile_tree(node)
+        except Exception as e:
+            # e.g. RuntimeError from expressions nested too deeply
+            with self.lock:
+                self.metrics['failed_promotions'] += 1
+                self.failures.append((node, e))
+            return None
+        finally:
+            with self.lock:
+                self.metrics['compile_time'] += time.time() - start
+        return compiled
+
+    def promote_program(self, statement_list, state):
+        compiled = self.compile(statement_list)
+        if compiled is not None:
+            state['compiled'] = compiled
+            with self.lock:
+                self.metrics['program_promotions'] += 1
+
+    def promote_loop(self, loop):
+        compiled = self.compile(loop)
+        if compiled is not None:
+            loop.compiled = self.timed_loop(compiled)
+            with self.lock:
+                self.metrics['loop_promotions'] += 1
+
+    def timed_loop(self, compiled):
+        def run(namespace):
+            start = time.time()
+            try:
+                compiled(namespace)
+            finally:
+                elapsed = time.time() - start
+                self.local.loop_time = getattr(self.local, 'loop_time', 0.0) + elapsed
+                with self.lock:
+                    self.metrics['compiled_loop_runs'] += 1
+                    self.metrics['compiled_loop_time'] += elapsed
+        return run
+
+    def wait(self):
+        """Block until all background promotions are done."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for thread in pending:
+            thread.join()